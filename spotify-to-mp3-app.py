@@ -4,11 +4,21 @@ import sys
 import time
 import threading
 import re
+import json
+import socket
+import argparse
+import shutil
+import subprocess
+import heapq
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                             QHBoxLayout, QPushButton, QLineEdit, QLabel, 
                             QProgressBar, QScrollArea, QFileDialog, QFrame,
-                            QMessageBox)
-from PyQt5.QtCore import Qt, QObject, QRunnable, QThreadPool, pyqtSignal, QUrl
+                            QMessageBox, QComboBox)
+from PyQt5.QtCore import Qt, QObject, QRunnable, QThreadPool, QTimer, pyqtSignal, QUrl
 from PyQt5.QtGui import QPixmap, QDesktopServices
 import requests
 import spotipy
@@ -30,6 +40,23 @@ os.makedirs(os.path.join(DOWNLOADS_DIR, "Track"), exist_ok=True)
 os.makedirs(os.path.join(DOWNLOADS_DIR, "Playlist"), exist_ok=True)
 os.makedirs(os.path.join(DOWNLOADS_DIR, "Album"), exist_ok=True)
 
+# Distributed mode settings
+COORDINATOR_PORT = 8765
+LEASE_TIMEOUT = 60 # Seconds without a heartbeat before a leased job is re-queued
+HEARTBEAT_INTERVAL = 15
+POLL_INTERVAL = 2 # Seconds an idle worker waits before asking for another job
+MAX_JOB_ATTEMPTS = 3
+
+# Library verification settings
+VERIFY_CACHE_FILE = ".verify_cache.json"
+DURATION_TOLERANCE = 15 # Seconds a file may differ from the Spotify duration (YouTube intros/outros)
+
+def sanitize_folder_name(name):
+    return "".join([c for c in name if c.isalpha() or c.isdigit() or c==' ']).rstrip()
+
+def sanitize_track_filename(track_info):
+    return "".join([c for c in f"{track_info['artist']} - {track_info['title']}" if c.isalnum() or c in (' ', '-', '_')]).rstrip()
+
 class WorkerSignals(QObject):
     progress_updated = pyqtSignal(str, int)
     download_finished = pyqtSignal(str, str)
@@ -40,24 +67,30 @@ class DownloadWorker(QRunnable):
     # download_finished = pyqtSignal(str, str)
     # download_error = pyqtSignal(str, str)
     
-    def __init__(self, track_id, track_info, download_dir):
+    def __init__(self, track_id, track_info, download_dir, overwrite=False):
         super().__init__()
         self.track_id = track_id
         self.track_info = track_info
         self.download_dir = download_dir
+        self.overwrite = overwrite # Set for files that failed verification
         self.signals = WorkerSignals()
         self.stopped = False
         
     def run(self):
+        temp_file = None
         try:
             # Search for the track on YouTube
             search_query = f"{self.track_info['artist']} - {self.track_info['title']}"
-            # Sanitize filename
-            safe_filename = "".join([c for c in f"{self.track_info['artist']} - {self.track_info['title']}" if c.isalnum() or c in (' ', '-', '_')]).rstrip()
+            safe_filename = sanitize_track_filename(self.track_info)
             output_file = os.path.join(self.download_dir, f"{safe_filename}.mp3")
             
+            # Download and convert under a hidden per-run name, the real name only ever holds a finished file
+            temp_name = f".{safe_filename}.{uuid.uuid4().hex[:8]}"
+            temp_file = os.path.join(self.download_dir, f"{temp_name}.mp3")
+            
             # If the file already exists, we can consider it completed and skip it.
-            if os.path.exists(output_file):
+            # A file that failed verification (overwrite) is replaced once the new download is done.
+            if os.path.exists(output_file) and not self.overwrite:
                 self.signals.progress_updated.emit(self.track_id, 100)
                 self.signals.download_finished.emit(self.track_id, output_file)
                 return 
@@ -81,20 +114,22 @@ class DownloadWorker(QRunnable):
                     'preferredquality': '192',
                 }],
                 'progress_hooks': [self._progress_hook],
-                'outtmpl': os.path.join(self.download_dir, f"{safe_filename}.%(ext)s")
+                'outtmpl': os.path.join(self.download_dir, f"{temp_name}.%(ext)s")
             }
             
             self.signals.progress_updated.emit(self.track_id, 20)
             
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                # Find the video
-                info = ydl.extract_info(search_query, download=False)
-                # Check if any video was found
-                if not info.get('entries'):
-                    raise VideoUnavailable("No search results found on YouTube.")
-                video_item = info['entries'][0]
-                self.track_info['thumbnail'] = video_item.get('thumbnail', '')
-                self.track_info['youtube_url'] = video_item.get('webpage_url', '')
+                # Skip the search if the video was already resolved (e.g. by the coordinator's cache)
+                if not self.track_info.get('youtube_url'):
+                    # Find the video
+                    info = ydl.extract_info(search_query, download=False)
+                    # Check if any video was found
+                    if not info or not info.get('entries'):
+                        raise VideoUnavailable("No search results found on YouTube.")
+                    video_item = info['entries'][0]
+                    self.track_info['thumbnail'] = video_item.get('thumbnail', '')
+                    self.track_info['youtube_url'] = video_item.get('webpage_url', '')
                 
                 self.signals.progress_updated.emit(self.track_id, 30)
                 
@@ -102,23 +137,31 @@ class DownloadWorker(QRunnable):
                     return
                     
                 # Download
-                ydl.download([video_item['webpage_url']])
+                ydl.download([self.track_info['youtube_url']])
                 
+            # A conversion that outlived a lost lease must not replace another worker's file
+            if self.stopped:
+                raise yt_dlp.utils.DownloadCancelled("Download stopped.")
+            
             # output_file = os.path.join(self.download_dir, f"{safe_filename}.mp3")
             # self.signals.download_finished.emit(self.track_id, output_file)
-            if os.path.exists(output_file) and os.path.getsize(output_file) > 1024:
+            if os.path.exists(temp_file) and os.path.getsize(temp_file) > 1024:
+                os.replace(temp_file, output_file)
                 self.signals.download_finished.emit(self.track_id, output_file)
             else:
                 raise Exception("File is empty or missing (skipped by downloader).")
             
         except Exception as e:
+            if temp_file and os.path.exists(temp_file):
+                os.remove(temp_file)
             self.signals.download_error.emit(self.track_id, str(e))
         finally:
             time.sleep(1)
     
     def _progress_hook(self, d):
+        # yt-dlp aborts the running download when a hook raises DownloadCancelled
         if self.stopped:
-            return
+            raise yt_dlp.utils.DownloadCancelled("Download stopped.")
         
         if d['status'] == 'downloading':
             p = d.get('_percent_str', '0%') # Progress percentage
@@ -226,13 +269,558 @@ class SpotifyClient:
             'duration_ms': track['duration_ms'],
             'spotify_url': track['external_urls']['spotify']
         }
+    
+    def get_tracks_and_folder(self, url):
+        # Returns the tracks and their download folder relative to DOWNLOADS_DIR (always "/" separated)
+        if self.is_playlist(url):
+            folder_name = sanitize_folder_name(self.get_playlist_name(url))
+            return self.get_tracks_from_playlist(url), f"Playlist/{folder_name}"
+        elif self.is_album(url):
+            folder_name = sanitize_folder_name(self.get_album_name(url))
+            return self.get_tracks_from_album(url), f"Album/{folder_name}"
+        elif self.is_track(url):
+            return [self.get_track(url)], "Track"
+        raise ValueError("Invalid Spotify URL. Please enter a track, playlist, or album URL.")
+
+class DownloadCoordinator:
+    # Holds the job queue and YouTube resolution cache shared by all download nodes
+    def __init__(self, lease_timeout=LEASE_TIMEOUT, max_attempts=MAX_JOB_ATTEMPTS):
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.jobs = {}
+        self.queue = deque()
+        self.leased = set()
+        self.resolution_cache = {} # track id -> {'youtube_url', 'thumbnail'}
+        self.next_job_id = 1
+        self.lock = threading.Lock()
+    
+    def add_tracks(self, tracks, download_dir, overwrite=False):
+        with self.lock:
+            for track in tracks:
+                job_id = str(self.next_job_id)
+                self.next_job_id += 1
+                self.jobs[job_id] = {
+                    'job_id': job_id,
+                    'track': track,
+                    'download_dir': download_dir,
+                    'overwrite': overwrite,
+                    'status': 'queued',
+                    'worker_id': None,
+                    'progress': 0,
+                    'attempts': 0,
+                    'lease_expires': 0,
+                    'file_path': '',
+                    'error': ''
+                }
+                self.queue.append(job_id)
+        return len(tracks)
+    
+    def lease(self, worker_id):
+        with self.lock:
+            self._requeue_expired()
+            if not self.queue:
+                return None
+            
+            job = self.jobs[self.queue[0]]
+            
+            # Hand out the cached YouTube match so the worker can skip the search
+            track = dict(job['track'])
+            track.update(self.resolution_cache.get(track['id'], {}))
+            payload = {
+                'job_id': job['job_id'],
+                'track': track,
+                'download_dir': job['download_dir'],
+                'overwrite': job['overwrite'],
+                'lease_timeout': self.lease_timeout
+            }
+            
+            # Only mark the job leased once the payload could be built
+            self.queue.popleft()
+            job['status'] = 'leased'
+            job['worker_id'] = worker_id
+            job['progress'] = 0
+            job['attempts'] += 1
+            job['lease_expires'] = time.time() + self.lease_timeout
+            self.leased.add(job['job_id'])
+            return payload
+    
+    def heartbeat(self, job_id, worker_id, progress):
+        with self.lock:
+            job = self._leased_job(job_id, worker_id)
+            if not job:
+                return False
+            job['progress'] = progress
+            job['lease_expires'] = time.time() + self.lease_timeout
+            return True
+    
+    def complete(self, job_id, worker_id, file_path, youtube_url='', thumbnail=''):
+        with self.lock:
+            job = self._leased_job(job_id, worker_id)
+            if not job:
+                return False
+            self.leased.discard(job_id)
+            job['status'] = 'completed'
+            job['progress'] = 100
+            job['file_path'] = file_path
+            if youtube_url:
+                self.resolution_cache[job['track']['id']] = {'youtube_url': youtube_url, 'thumbnail': thumbnail}
+            return True
+    
+    def fail(self, job_id, worker_id, error):
+        with self.lock:
+            job = self._leased_job(job_id, worker_id)
+            if not job:
+                return False
+            job['error'] = error
+            # The cached match may be the reason it failed, so let the next attempt search again
+            self.resolution_cache.pop(job['track']['id'], None)
+            self._retry_or_fail(job)
+            return True
+    
+    def status(self):
+        with self.lock:
+            self._requeue_expired()
+            counts = {'queued': 0, 'leased': 0, 'completed': 0, 'failed': 0}
+            for job in self.jobs.values():
+                counts[job['status']] += 1
+            return {
+                'counts': counts,
+                'leased': [{key: self.jobs[job_id][key] for key in ('job_id', 'worker_id', 'progress', 'attempts')}
+                           for job_id in self.leased],
+                'failed': [{'job_id': job['job_id'], 'track_id': job['track']['id'], 'error': job['error']}
+                           for job in self.jobs.values() if job['status'] == 'failed'],
+                'cached_resolutions': len(self.resolution_cache)
+            }
+    
+    def _leased_job(self, job_id, worker_id):
+        # Reports from a worker that lost its lease are ignored
+        job = self.jobs.get(job_id)
+        if job and job['status'] == 'leased' and job['worker_id'] == worker_id:
+            return job
+        return None
+    
+    def _retry_or_fail(self, job):
+        self.leased.discard(job['job_id'])
+        job['worker_id'] = None
+        if job['attempts'] >= self.max_attempts:
+            job['status'] = 'failed'
+        else:
+            job['status'] = 'queued'
+            self.queue.append(job['job_id'])
+    
+    def _requeue_expired(self):
+        now = time.time()
+        for job_id in list(self.leased):
+            job = self.jobs[job_id]
+            if job['lease_expires'] < now:
+                job['error'] = "Lease expired (no heartbeat from worker)."
+                self._retry_or_fail(job)
+
+class CoordinatorRequestHandler(BaseHTTPRequestHandler):
+    # JSON over HTTP: GET /status, POST /jobs, /lease, /heartbeat, /complete, /fail
+    def do_GET(self):
+        if self.path == '/status':
+            self._send_json(200, self.server.coordinator.status())
+        else:
+            self._send_json(404, {'error': "Not found"})
+    
+    def do_POST(self):
+        coordinator = self.server.coordinator
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            data = json.loads(self.rfile.read(length) or b'{}')
+            
+            if self.path == '/jobs':
+                if 'url' in data:
+                    tracks, download_dir = self._get_spotify_client().get_tracks_and_folder(data['url'])
+                else:
+                    tracks, download_dir = data['tracks'], data.get('download_dir', "Track")
+                    self._validate_tracks(tracks, download_dir)
+                queued = coordinator.add_tracks(tracks, download_dir, bool(data.get('overwrite', False)))
+                self._send_json(200, {'queued': queued})
+            elif self.path == '/lease':
+                self._send_json(200, {'job': coordinator.lease(data['worker_id'])})
+            elif self.path == '/heartbeat':
+                ok = coordinator.heartbeat(data['job_id'], data['worker_id'], data.get('progress', 0))
+                self._send_lease_result(ok)
+            elif self.path == '/complete':
+                ok = coordinator.complete(data['job_id'], data['worker_id'], data.get('file_path', ''),
+                                          data.get('youtube_url', ''), data.get('thumbnail', ''))
+                self._send_lease_result(ok)
+            elif self.path == '/fail':
+                ok = coordinator.fail(data['job_id'], data['worker_id'], data.get('error', ''))
+                self._send_lease_result(ok)
+            else:
+                self._send_json(404, {'error': "Not found"})
+        except (KeyError, TypeError, ValueError) as e:
+            self._send_json(400, {'error': str(e)})
+        except Exception as e:
+            self._send_json(500, {'error': str(e)})
+    
+    def _validate_tracks(self, tracks, download_dir):
+        # Raising ValueError answers with a 400 before anything is queued
+        if not isinstance(tracks, list) or not isinstance(download_dir, str):
+            raise ValueError("'tracks' must be a list and 'download_dir' a string.")
+        for track in tracks:
+            if not isinstance(track, dict) or not all(track.get(key) for key in ('id', 'title', 'artist')):
+                raise ValueError("Every track needs an 'id', 'title' and 'artist'.")
+    
+    def _get_spotify_client(self):
+        # Created on first use so the coordinator can run without Spotify credentials
+        if self.server.spotify_client is None:
+            self.server.spotify_client = SpotifyClient()
+        return self.server.spotify_client
+    
+    def _send_lease_result(self, ok):
+        if ok:
+            self._send_json(200, {'ok': True})
+        else:
+            self._send_json(409, {'error': "Job is not leased by this worker"})
+    
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass # Keep the console for our own messages
+
+def run_coordinator(host, port):
+    server = ThreadingHTTPServer((host, port), CoordinatorRequestHandler)
+    server.coordinator = DownloadCoordinator()
+    server.spotify_client = None
+    print(f"Coordinator listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+class RemoteWorker:
+    # Headless download node: leases jobs from a coordinator and runs them with DownloadWorker
+    def __init__(self, coordinator_url, output_dir=DOWNLOADS_DIR, worker_id=None):
+        self.coordinator_url = coordinator_url.rstrip('/')
+        self.output_dir = output_dir
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.session = requests.Session()
+        self.progress = 0
+    
+    def run(self):
+        print(f"Worker {self.worker_id} polling {self.coordinator_url}")
+        while True:
+            try:
+                job = self._post('/lease', {'worker_id': self.worker_id}).json().get('job')
+            except (requests.RequestException, ValueError) as e:
+                print(f"Coordinator unreachable: {e}")
+                job = None
+            
+            if job:
+                try:
+                    self.run_job(job)
+                except Exception as e:
+                    # A broken job (bad payload, unwritable storage) must not take the worker down
+                    self._report_failure(job, str(e))
+            else:
+                time.sleep(POLL_INTERVAL)
+    
+    def run_job(self, job):
+        track = job['track']
+        download_dir = self._resolve_download_dir(job['download_dir'])
+        os.makedirs(download_dir, exist_ok=True)
+        print(f"Downloading {track['artist']} - {track['title']}")
+        
+        # Runs in this thread, so the signals are delivered directly without a Qt event loop
+        worker = DownloadWorker(track['id'], track, download_dir, job.get('overwrite', False))
+        result = {}
+        self.progress = 0
+        worker.signals.progress_updated.connect(lambda _, progress: setattr(self, 'progress', progress))
+        worker.signals.download_finished.connect(lambda _, file_path: result.update(file_path=file_path))
+        worker.signals.download_error.connect(lambda _, error: result.update(error=error))
+        
+        finished = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat_loop, args=(job, worker, finished), daemon=True)
+        heartbeat.start()
+        try:
+            worker.run()
+        finally:
+            finished.set()
+            heartbeat.join()
+        
+        if worker.stopped:
+            return # Lease was lost, the coordinator has already re-queued the job
+        
+        try:
+            if 'file_path' in result:
+                self._post('/complete', {
+                    'worker_id': self.worker_id,
+                    'job_id': job['job_id'],
+                    'file_path': result['file_path'],
+                    'youtube_url': track.get('youtube_url', ''),
+                    'thumbnail': track.get('thumbnail', '')
+                })
+            else:
+                self._report_failure(job, result.get('error', "Download stopped before finishing."))
+        except requests.RequestException as e:
+            # The lease will expire and the job is re-queued
+            print(f"Could not report job {job['job_id']}: {e}")
+    
+    def _report_failure(self, job, error):
+        print(f"Error: {error}")
+        try:
+            self._post('/fail', {
+                'worker_id': self.worker_id,
+                'job_id': job.get('job_id'),
+                'error': error
+            })
+        except requests.RequestException as e:
+            # The lease will expire and the job is re-queued
+            print(f"Could not report job {job.get('job_id')}: {e}")
+    
+    def _heartbeat_loop(self, job, worker, finished):
+        interval = min(HEARTBEAT_INTERVAL, job['lease_timeout'] / 3)
+        while not finished.wait(interval):
+            try:
+                response = self._post('/heartbeat', {
+                    'worker_id': self.worker_id,
+                    'job_id': job['job_id'],
+                    'progress': self.progress
+                })
+            except requests.RequestException:
+                continue # Keep downloading, the coordinator may come back before the lease expires
+            if response.status_code == 409:
+                # Aborts the download at its next progress update, each run writes its own temp file anyway
+                worker.stop()
+                return
+    
+    def _resolve_download_dir(self, relative_dir):
+        # Folders come from the coordinator, so never let them escape the output directory
+        parts = [part for part in relative_dir.split('/') if part not in ('', '.', '..')]
+        return os.path.join(self.output_dir, *parts)
+    
+    def _post(self, path, data):
+        return self.session.post(f"{self.coordinator_url}{path}", json=data, timeout=30)
+
+def probe_audio_file(path):
+    # Runs in a pool thread: fully decodes the file and returns the decoded duration
+    try:
+        process = subprocess.run(
+            ['ffmpeg', '-v', 'error', '-nostats', '-progress', 'pipe:1', '-i', path, '-f', 'null', '-'],
+            capture_output=True, text=True, timeout=300
+        )
+    except (subprocess.SubprocessError, OSError) as e:
+        return {'ok': False, 'duration': None, 'error': str(e)}
+    
+    # -progress reports the decoded position in microseconds (out_time_ms is microseconds too)
+    progress = dict(line.split('=', 1) for line in process.stdout.splitlines() if '=' in line)
+    try:
+        duration = int(progress.get('out_time_us', progress.get('out_time_ms', ''))) / 1000000
+    except ValueError:
+        duration = None
+    
+    errors = process.stderr.strip()
+    if process.returncode != 0 or errors or not duration:
+        error = errors.splitlines()[0] if errors else "File could not be decoded."
+        return {'ok': False, 'duration': duration, 'error': error}
+    return {'ok': True, 'duration': duration, 'error': ''}
+
+class LibraryVerifier:
+    # Checks downloaded files decode and match the Spotify duration, caching results by (path, size, mtime)
+    def __init__(self, folder, max_workers=None):
+        self.folder = folder
+        self.max_workers = max_workers or os.cpu_count()
+        self.cache_file = os.path.join(folder, VERIFY_CACHE_FILE)
+    
+    def scan(self, folder=None):
+        # Yields every mp3 below the folder, os.scandir already carries the stat we need.
+        # Hidden files are downloads still in progress (see DownloadWorker.run).
+        with os.scandir(folder or self.folder) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    yield from self.scan(entry.path)
+                elif entry.is_file() and entry.name.lower().endswith('.mp3') and not entry.name.startswith('.'):
+                    yield entry
+    
+    def verify(self, tracks=None):
+        if not shutil.which('ffmpeg'):
+            raise RuntimeError("ffmpeg is required to verify files.")
+        
+        cache = self._load_cache()
+        results = {}
+        to_probe = {}
+        for entry in self.scan():
+            stat = entry.stat()
+            key = os.path.relpath(entry.path, self.folder)
+            cached = cache.get(key)
+            if cached and cached['size'] == stat.st_size and cached['mtime'] == stat.st_mtime:
+                results[key] = cached
+            else:
+                to_probe[key] = (entry.path, stat.st_size, stat.st_mtime)
+        
+        if to_probe:
+            # Each probe is an ffmpeg subprocess, so threads decode in parallel without forking the (Qt) process
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                paths = [path for path, _, _ in to_probe.values()]
+                for key, probe in zip(to_probe, executor.map(probe_audio_file, paths)):
+                    _, size, mtime = to_probe[key]
+                    results[key] = dict(probe, size=size, mtime=mtime)
+        
+        # Only files still on disk are kept, so the cache never grows stale
+        self._save_cache(results)
+        return self._build_report(results, tracks, len(to_probe))
+    
+    def _build_report(self, results, tracks, probed):
+        report = {
+            'checked': len(results),
+            'probed': probed,
+            'broken': {key: result['error'] for key, result in results.items() if not result['ok']},
+            'truncated': {},
+            'mismatched': {},
+            'missing': [],
+            'requeue': []
+        }
+        
+        # Without Spotify tracks only decodability can be checked
+        for track in tracks or []:
+            key = f"{sanitize_track_filename(track)}.mp3"
+            result = results.get(key)
+            if result is None:
+                report['missing'].append(key)
+                report['requeue'].append(track)
+            elif not result['ok']:
+                report['requeue'].append(track)
+            else:
+                expected = track['duration_ms'] / 1000
+                reason = f"{result['duration']:.0f}s on disk, {expected:.0f}s on Spotify"
+                # A cut-off mp3 still decodes cleanly, being too short is how an interrupted download shows
+                if result['duration'] < expected - DURATION_TOLERANCE:
+                    report['truncated'][key] = reason
+                    report['requeue'].append(track)
+                elif result['duration'] > expected + DURATION_TOLERANCE:
+                    # Only reported, the same search would download the same (longer) video again
+                    report['mismatched'][key] = reason
+        return report
+    
+    def _load_cache(self):
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def _save_cache(self, results):
+        temp_file = f"{self.cache_file}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(results, f)
+        os.replace(temp_file, self.cache_file)
+
+class VerifySignals(QObject):
+    verify_finished = pyqtSignal(object)
+    verify_error = pyqtSignal(str)
+
+class VerifyWorker(QRunnable):
+    def __init__(self, folder, tracks):
+        super().__init__()
+        self.folder = folder
+        self.tracks = tracks
+        self.signals = VerifySignals()
+    
+    def run(self):
+        try:
+            report = LibraryVerifier(self.folder).verify(self.tracks)
+            self.signals.verify_finished.emit(report)
+        except Exception as e:
+            self.signals.verify_error.emit(str(e))
+
+class DownloadScheduler:
+    # Hands workers to the thread pool only as slots free up, so queued work can be reordered without touching running downloads
+    POLICIES = {
+        'playlist': "Playlist order",
+        'visible': "Visible first",
+        'shortest': "Shortest first"
+    }
+    
+    def __init__(self, threadpool, policy='playlist'):
+        self.threadpool = threadpool
+        self.policy = policy
+        # Keyed by submission order, a playlist can contain the same track more than once
+        self.pending = {} # order -> (worker, track)
+        self.heap = []
+        self.running = {} # order -> worker
+        self.promoted = {} # order -> promotion order
+        self.visible = set() # track ids
+        self.next_order = 0
+        self.next_promotion = 0
+    
+    def submit(self, worker, track):
+        order = self.next_order
+        self.next_order += 1
+        self.pending[order] = (worker, track)
+        heapq.heappush(self.heap, (self._priority(order, track), order))
+        self.dispatch()
+    
+    def task_done(self, worker):
+        for order, running_worker in list(self.running.items()):
+            if running_worker is worker:
+                del self.running[order]
+        self.dispatch()
+    
+    def dispatch(self):
+        while self.heap and len(self.running) < self.threadpool.maxThreadCount():
+            _, order = heapq.heappop(self.heap)
+            worker, _ = self.pending.pop(order)
+            self.promoted.pop(order, None)
+            self.running[order] = worker
+            self.threadpool.start(worker)
+    
+    def pending_track_ids(self):
+        return {track['id'] for _, track in self.pending.values()}
+    
+    def set_policy(self, policy):
+        self.policy = policy
+        self._rebuild()
+    
+    def set_visible(self, track_ids):
+        self.visible = set(track_ids)
+        if self.policy == 'visible':
+            self._rebuild()
+    
+    def promote(self, track_id):
+        # Promoted tracks go before every policy, the latest promotion first
+        orders = [order for order, (_, track) in self.pending.items() if track['id'] == track_id]
+        if not orders:
+            return False
+        for order in orders:
+            self.promoted[order] = self.next_promotion
+        self.next_promotion += 1
+        self._rebuild()
+        return True
+    
+    def _priority(self, order, track):
+        if order in self.promoted:
+            return (0, -self.promoted[order])
+        if self.policy == 'shortest':
+            return (1, track.get('duration_ms', 0))
+        if self.policy == 'visible':
+            return (1, track['id'] not in self.visible, order)
+        return (1, order)
+    
+    def _rebuild(self):
+        self.heap = [(self._priority(order, track), order) for order, (_, track) in self.pending.items()]
+        heapq.heapify(self.heap)
 
 class DownloadCard(QFrame):
+    promote_requested = pyqtSignal(str)
+    
     def __init__(self, track_id, track_info, parent=None):
         super().__init__(parent)
         self.track_id = track_id
         self.track_info = track_info
         self.file_path = ""
+        self.setToolTip("Double-click to download this track next")
         
         self.setStyleSheet("""
             QFrame {
@@ -328,6 +916,10 @@ class DownloadCard(QFrame):
         else:
             self.thumbnail_label.setText("Loading...")
     
+    def mouseDoubleClickEvent(self, event):
+        self.promote_requested.emit(self.track_id)
+        super().mouseDoubleClickEvent(event)
+    
     def set_progress(self, progress):
         self.progress_bar.setValue(progress)
         self.progress_bar.setFormat("%p%") # Show percentage
@@ -366,6 +958,7 @@ class MainWindow(QMainWindow):
         self.download_cards = {}
         self.threadpool = QThreadPool()
         self.threadpool.setMaxThreadCount(4) 
+        self.scheduler = DownloadScheduler(self.threadpool)
         self.active_download_count = 0
         
         # Set application style
@@ -437,8 +1030,31 @@ class MainWindow(QMainWindow):
         """)
         self.download_btn.clicked.connect(self.process_url)
         
+        self.verify_btn = QPushButton("Verify")
+        self.verify_btn.setToolTip("Check the downloaded files for this URL and download broken ones again")
+        self.verify_btn.setStyleSheet("""
+            QPushButton {
+                background-color: white;
+                color: #1DB954;
+                border: 2px solid #1DB954;
+                border-radius: 8px;
+                padding: 10px 20px;
+                font-weight: bold;
+                font-size: 14px;
+            }
+            QPushButton:hover {
+                background-color: #F0FBF4;
+            }
+            QPushButton:disabled {
+                color: #c0c0c0;
+                border-color: #e0e0e0;
+            }
+        """)
+        self.verify_btn.clicked.connect(self.verify_library)
+        
         input_layout.addWidget(self.url_input, 4)
         input_layout.addWidget(self.download_btn, 1)
+        input_layout.addWidget(self.verify_btn, 1)
         
         # Header for downloads section
         downloads_header = QLabel("Downloads")
@@ -449,6 +1065,28 @@ class MainWindow(QMainWindow):
             margin-top: 10px;
         """)
         
+        # Download order for queued tracks, can be changed while downloading
+        self.priority_combo = QComboBox()
+        for policy, label in DownloadScheduler.POLICIES.items():
+            self.priority_combo.addItem(label, policy)
+        self.priority_combo.setStyleSheet("""
+            QComboBox {
+                padding: 4px 8px;
+                border: 2px solid #e0e0e0;
+                border-radius: 6px;
+                background-color: white;
+                font-size: 13px;
+                color: #333333;
+                margin-top: 10px;
+            }
+        """)
+        self.priority_combo.currentIndexChanged.connect(self.change_priority_policy)
+        
+        downloads_header_layout = QHBoxLayout()
+        downloads_header_layout.addWidget(downloads_header)
+        downloads_header_layout.addStretch()
+        downloads_header_layout.addWidget(self.priority_combo)
+        
         # Scroll area for downloads
         self.scroll_area = QScrollArea()
         self.scroll_area.setWidgetResizable(True)
@@ -494,6 +1132,13 @@ class MainWindow(QMainWindow):
         self.scroll_layout.setSpacing(0)
         self.scroll_area.setWidget(self.scroll_content)
         
+        # Visible tracks are collected once scrolling settles rather than on every scroll step
+        self.visibility_timer = QTimer(self)
+        self.visibility_timer.setSingleShot(True)
+        self.visibility_timer.setInterval(150)
+        self.visibility_timer.timeout.connect(self.update_visible_tracks)
+        self.scroll_area.verticalScrollBar().valueChanged.connect(self.visibility_timer.start)
+        
         # Status bar
         self.status_label = QLabel("Ready")
         self.status_label.setStyleSheet("""
@@ -505,7 +1150,7 @@ class MainWindow(QMainWindow):
         
         main_layout.addWidget(title_label)
         main_layout.addLayout(input_layout)
-        main_layout.addWidget(downloads_header)
+        main_layout.addLayout(downloads_header_layout)
         main_layout.addWidget(self.scroll_area)
         main_layout.addWidget(self.status_label)
         
@@ -520,6 +1165,7 @@ class MainWindow(QMainWindow):
             
         # self.status_label.setText("Processing URL...")
         self.download_btn.setEnabled(False)
+        self.verify_btn.setEnabled(False)
         self.download_btn.setStyleSheet("""
             QPushButton {
                 background-color: #E74C3C;
@@ -533,60 +1179,24 @@ class MainWindow(QMainWindow):
         """)
         
         try:
-            # Sanitize folder name helper function
-            def sanitize_folder_name(name):
-                return "".join([c for c in name if c.isalpha() or c.isdigit() or c==' ']).rstrip()
-            
-            if self.spotify_client.is_playlist(url):
-                self.status_label.setText("Fetching playlist tracks...")
-                playlist_name = self.spotify_client.get_playlist_name(url)
-                folder_name = sanitize_folder_name(playlist_name)
-                tracks = self.spotify_client.get_tracks_from_playlist(url)
-                download_dir = os.path.join(DOWNLOADS_DIR, "Playlist", folder_name)
-            elif self.spotify_client.is_album(url):
-                self.status_label.setText("Fetching album tracks...")
-                album_name = self.spotify_client.get_album_name(url)
-                folder_name = sanitize_folder_name(album_name)
-                tracks = self.spotify_client.get_tracks_from_album(url)
-                download_dir = os.path.join(DOWNLOADS_DIR, "Album", folder_name)
-            elif self.spotify_client.is_track(url):
-                self.status_label.setText("Fetching track...")
-                tracks = [self.spotify_client.get_track(url)]
-                download_dir = os.path.join(DOWNLOADS_DIR, "Track")
-            else:
-                self.show_error("Invalid Spotify URL. Please enter a track, playlist, or album URL.")
-                self.download_btn.setEnabled(True)
-                self.download_btn.setStyleSheet("""
-                    QPushButton {
-                        background-color: #1DB954;
-                        color: white;
-                        border: none;
-                        border-radius: 8px;
-                        padding: 12px 20px;
-                        font-weight: bold;
-                        font-size: 14px;
-                    }
-                    QPushButton:hover {
-                        background-color: #1ED760;
-                    }
-                    QPushButton:pressed {
-                        background-color: #1AA246;
-                    }
-                """)
-                return
+            self.status_label.setText("Fetching tracks...")
+            tracks, folder = self.spotify_client.get_tracks_and_folder(url)
+            download_dir = os.path.join(DOWNLOADS_DIR, *folder.split('/'))
             
             os.makedirs(download_dir, exist_ok=True)
             
             self.status_label.setText(f"Found {len(tracks)} track(s). Starting download...")
             self.active_download_count = len(tracks)
             
-            for track in tracks:
-                self.add_download_task(track, download_dir)
+            for position, track in enumerate(tracks):
+                self.add_download_task(track, download_dir, position=position)
+            self.visibility_timer.start()
             
         except Exception as e:
             #self.show_error(f"Error processing URL: {str(e)}")
             self.show_error("Invalid Spotify URL. Please enter a track, playlist, or album URL.")
             self.download_btn.setEnabled(True)
+            self.verify_btn.setEnabled(True)
             self.download_btn.setStyleSheet("""
                 QPushButton {
                     background-color: #1DB954;
@@ -607,28 +1217,115 @@ class MainWindow(QMainWindow):
         
         # self.download_btn.setEnabled(True)
     
-    def add_download_task(self, track, download_dir):
+    def verify_library(self):
+        url = self.url_input.text().strip()
+        if not url:
+            self.show_error("Please enter a valid Spotify URL")
+            return
+        
+        try:
+            self.status_label.setText("Fetching tracks...")
+            tracks, folder = self.spotify_client.get_tracks_and_folder(url)
+        except Exception:
+            self.show_error("Invalid Spotify URL. Please enter a track, playlist, or album URL.")
+            return
+        
+        download_dir = os.path.join(DOWNLOADS_DIR, *folder.split('/'))
+        if not os.path.isdir(download_dir):
+            self.show_error("Nothing has been downloaded for this URL yet.")
+            return
+        
+        self.download_btn.setEnabled(False)
+        self.verify_btn.setEnabled(False)
+        self.download_btn.setStyleSheet("""
+            QPushButton {
+                background-color: #E74C3C;
+                color: white;
+                border: none;
+                border-radius: 8px;
+                padding: 12px 20px;
+                font-weight: bold;
+                font-size: 14px;
+            }
+        """)
+        self.status_label.setText(f"Verifying {len(tracks)} track(s)...")
+        
+        # Probing runs in its own pool, this only keeps the UI responsive while waiting for it
+        worker = VerifyWorker(download_dir, tracks)
+        worker.signals.verify_finished.connect(lambda report: self.verification_finished(report, download_dir))
+        worker.signals.verify_error.connect(self.verification_error)
+        self.threadpool.start(worker)
+    
+    def verification_finished(self, report, download_dir):
+        requeue = report['requeue']
+        mismatched = len(report['mismatched'])
+        if not requeue:
+            self.check_all_completed()
+            if mismatched:
+                self.status_label.setText(f"No broken files, {mismatched} track(s) are longer than on Spotify (likely a different version)")
+            else:
+                self.status_label.setText(f"All tracks verified ({report['checked']} file(s) checked)")
+            return
+        
+        self.status_label.setText(f"{len(requeue)} track(s) missing, broken or cut off. Downloading again...")
+        self.active_download_count = len(requeue)
+        for position, track in enumerate(requeue):
+            self.add_download_task(track, download_dir, overwrite=True, position=position)
+        self.visibility_timer.start()
+    
+    def verification_error(self, error_message):
+        self.check_all_completed()
+        self.show_error(error_message)
+    
+    def add_download_task(self, track, download_dir, overwrite=False, position=0):
         track_id = track['id']
         
         # Create card
         card = DownloadCard(track_id, track)
+        card.promote_requested.connect(self.promote_track)
         self.download_cards[track_id] = card
         
-        # Add new cards at the top
+        # New batches go on top, position keeps the batch itself in playlist order
         # if self.scroll_layout.count() > 0:
         #     self.scroll_layout.insertWidget(0, card)
         # else:
         #     self.scroll_layout.addWidget(card)
-        self.scroll_layout.insertWidget(0, card)
+        self.scroll_layout.insertWidget(position, card)
         
         # Create worker
-        worker = DownloadWorker(track_id, track, download_dir)
+        worker = DownloadWorker(track_id, track, download_dir, overwrite)
         worker.signals.progress_updated.connect(self.update_progress)
         worker.signals.download_finished.connect(self.download_completed)
         worker.signals.download_error.connect(self.download_error)
+        # The worker itself frees its slot, track ids are not unique within a playlist
+        worker.signals.download_finished.connect(lambda *_, worker=worker: self.scheduler.task_done(worker))
+        worker.signals.download_error.connect(lambda *_, worker=worker: self.scheduler.task_done(worker))
         
         self.download_workers[track_id] = worker
-        self.threadpool.start(worker) # worker.start()
+        self.scheduler.submit(worker, track) # worker.start()
+    
+    def change_priority_policy(self, index):
+        policy = self.priority_combo.itemData(index)
+        if policy == 'visible':
+            self.scheduler.visible = set(self.get_visible_pending_tracks())
+        self.scheduler.set_policy(policy)
+    
+    def promote_track(self, track_id):
+        if self.scheduler.promote(track_id):
+            self.status_label.setText(f"{self.download_cards[track_id].track_info['title']} will download next")
+    
+    def update_visible_tracks(self):
+        if self.scheduler.policy == 'visible':
+            self.scheduler.set_visible(self.get_visible_pending_tracks())
+    
+    def get_visible_pending_tracks(self):
+        # Only queued cards matter, visibleRegion is clipped by the scroll area viewport
+        return [track_id for track_id in self.scheduler.pending_track_ids()
+                if track_id in self.download_cards and not self.download_cards[track_id].visibleRegion().isEmpty()]
+    
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.visibility_timer.start()
     
     def update_progress(self, track_id, progress):
         if track_id in self.download_cards:
@@ -669,6 +1366,7 @@ class MainWindow(QMainWindow):
         if self.active_download_count == 0:
             self.status_label.setText("All downloads completed")
             self.download_btn.setEnabled(True)
+            self.verify_btn.setEnabled(True)
             self.download_btn.setStyleSheet("""
                 QPushButton {
                     background-color: #1DB954;
@@ -693,12 +1391,98 @@ class MainWindow(QMainWindow):
         # Display error message only in the status label
         self.status_label.setText(f"Error: {message}")
 
-if __name__ == "__main__":
-    app = QApplication(sys.argv)
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Spotify to MP3 downloader. Starts the desktop app when no mode is given.")
+    subparsers = parser.add_subparsers(dest='mode')
+    
+    coordinator_parser = subparsers.add_parser('coordinator', help="Hold the job queue for distributed workers")
+    coordinator_parser.add_argument('--host', default='127.0.0.1')
+    coordinator_parser.add_argument('--port', type=int, default=COORDINATOR_PORT)
+    
+    worker_parser = subparsers.add_parser('worker', help="Headless download node")
+    worker_parser.add_argument('coordinator_url')
+    worker_parser.add_argument('--output', default=DOWNLOADS_DIR, help="Library root, may be shared storage")
+    worker_parser.add_argument('--id', dest='worker_id')
+    
+    submit_parser = subparsers.add_parser('submit', help="Queue a Spotify URL on a coordinator")
+    submit_parser.add_argument('coordinator_url')
+    submit_parser.add_argument('spotify_url')
     
-    # Set application style
-    app.setStyle("Fusion")
+    status_parser = subparsers.add_parser('status', help="Show coordinator progress")
+    status_parser.add_argument('coordinator_url')
     
-    window = MainWindow()
-    window.show()
-    sys.exit(app.exec_())
\ No newline at end of file
+    verify_parser = subparsers.add_parser('verify', help="Check downloaded files and re-queue broken ones")
+    verify_parser.add_argument('folder', nargs='?', help="Folder to scan, defaults to the folder of --url")
+    verify_parser.add_argument('--url', help="Spotify URL to compare durations against")
+    verify_parser.add_argument('--output', default=DOWNLOADS_DIR, help="Library root used with --url")
+    verify_parser.add_argument('--submit', metavar='COORDINATOR_URL', help="Queue broken tracks on a coordinator (needs --url)")
+    return parser
+
+def run_verify(folder, spotify_url, output_dir, coordinator_url):
+    tracks, relative_dir = None, None
+    if spotify_url:
+        tracks, relative_dir = SpotifyClient().get_tracks_and_folder(spotify_url)
+        folder = folder or os.path.join(output_dir, *relative_dir.split('/'))
+    if not folder:
+        sys.exit("Error: give a folder or --url to verify.")
+    if coordinator_url and not spotify_url:
+        sys.exit("Error: --submit needs --url to know which tracks to re-queue.")
+    url_folder = os.path.join(output_dir, *relative_dir.split('/')) if relative_dir else None
+    if coordinator_url and os.path.abspath(folder) != os.path.abspath(url_folder):
+        sys.exit("Error: --submit re-queues into the --url folder, leave out the folder argument.")
+    if not os.path.isdir(folder):
+        sys.exit(f"Error: {folder} does not exist, nothing has been downloaded there yet.")
+    
+    try:
+        report = LibraryVerifier(folder).verify(tracks)
+    except (RuntimeError, OSError) as e:
+        sys.exit(f"Error: {e}")
+    for name, error in report['broken'].items():
+        print(f"Broken: {name} ({error})")
+    for name, reason in report['truncated'].items():
+        print(f"Truncated: {name} ({reason})")
+    for name, reason in report['mismatched'].items():
+        print(f"Longer than on Spotify: {name} ({reason})")
+    for name in report['missing']:
+        print(f"Missing: {name}")
+    print(f"Checked {report['checked']} file(s), {report['probed']} new or changed since the last run.")
+    
+    if coordinator_url and report['requeue']:
+        try:
+            response = requests.post(f"{coordinator_url.rstrip('/')}/jobs", json={
+                'tracks': report['requeue'],
+                'download_dir': relative_dir,
+                'overwrite': True
+            }, timeout=120)
+            if response.status_code != 200:
+                sys.exit(f"Error: coordinator answered HTTP {response.status_code}: {response.text.strip()}")
+            queued = response.json().get('queued', 0)
+        except (requests.RequestException, ValueError) as e:
+            sys.exit(f"Error: could not re-queue tracks on {coordinator_url}: {e}")
+        print(f"Re-queued {queued} track(s) on {coordinator_url}")
+
+if __name__ == "__main__":
+    # Unknown arguments are left for Qt
+    args, _ = build_arg_parser().parse_known_args()
+    
+    if args.mode == 'coordinator':
+        run_coordinator(args.host, args.port)
+    elif args.mode == 'worker':
+        RemoteWorker(args.coordinator_url, args.output, args.worker_id).run()
+    elif args.mode == 'submit':
+        response = requests.post(f"{args.coordinator_url.rstrip('/')}/jobs", json={'url': args.spotify_url}, timeout=120)
+        print(response.json())
+    elif args.mode == 'status':
+        response = requests.get(f"{args.coordinator_url.rstrip('/')}/status", timeout=30)
+        print(json.dumps(response.json(), indent=2))
+    elif args.mode == 'verify':
+        run_verify(args.folder, args.url, args.output, args.submit)
+    else:
+        app = QApplication(sys.argv)
+        
+        # Set application style
+        app.setStyle("Fusion")
+        
+        window = MainWindow()
+        window.show()
+        sys.exit(app.exec_())
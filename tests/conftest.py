@@ -0,0 +1,28 @@
+import importlib.util
+import os
+from pathlib import Path
+
+import pytest
+
+APP_PATH = Path(__file__).resolve().parent.parent / "spotify-to-mp3-app.py"
+
+
+def load_app():
+    # The app is a single script with a dash in its name, so it is loaded by path
+    spec = importlib.util.spec_from_file_location("spotify_to_mp3_app", APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="session")
+def home_dir(tmp_path_factory):
+    # The app creates its download folders under ~ on import
+    home = tmp_path_factory.mktemp("home")
+    os.environ["HOME"] = str(home)
+    return home
+
+
+@pytest.fixture(scope="session")
+def app(home_dir):
+    return load_app()
@@ -0,0 +1,184 @@
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import pytest
+import requests
+
+from conftest import APP_PATH
+
+# Runs a real RemoteWorker against the coordinator, only the YouTube download is replaced
+WORKER_SCRIPT = """
+import importlib.util, os, sys, time
+spec = importlib.util.spec_from_file_location("spotify_to_mp3_app", sys.argv[1])
+app = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(app)
+
+def fake_run(self):
+    time.sleep(0.3)
+    path = os.path.join(self.download_dir, app.sanitize_track_filename(self.track_info) + ".mp3")
+    with open(path, "w") as f:
+        f.write(sys.argv[3])
+    self.signals.download_finished.emit(self.track_id, path)
+
+app.DownloadWorker.run = fake_run
+app.RemoteWorker(sys.argv[2], sys.argv[4], sys.argv[3]).run()
+"""
+
+
+def make_track(number):
+    return {'id': f"id{number}", 'title': f"Title {number}", 'artist': "Artist", 'duration_ms': 1000}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(condition, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if condition():
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+@pytest.fixture
+def coordinator_url(app):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), app.CoordinatorRequestHandler)
+    server.coordinator = app.DownloadCoordinator()
+    server.spotify_client = None
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_lease_heartbeat_complete(app):
+    coordinator = app.DownloadCoordinator()
+    coordinator.add_tracks([make_track(1)], "Playlist/Mix")
+    
+    job = coordinator.lease('w1')
+    assert job['track']['id'] == "id1"
+    assert job['download_dir'] == "Playlist/Mix"
+    assert coordinator.lease('w2') is None
+    
+    assert coordinator.heartbeat(job['job_id'], 'w1', 50)
+    assert coordinator.status()['leased'][0]['progress'] == 50
+    
+    assert coordinator.complete(job['job_id'], 'w1', "/music/a.mp3", "https://youtu.be/x", "thumb.jpg")
+    status = coordinator.status()
+    assert status['counts'] == {'queued': 0, 'leased': 0, 'completed': 1, 'failed': 0}
+    assert status['cached_resolutions'] == 1
+    
+    # The same track queued again reuses the resolved video
+    coordinator.add_tracks([make_track(1)], "Track")
+    assert coordinator.lease('w2')['track']['youtube_url'] == "https://youtu.be/x"
+
+
+def test_expired_lease_is_requeued_until_max_attempts(app):
+    coordinator = app.DownloadCoordinator(lease_timeout=0.05, max_attempts=2)
+    coordinator.add_tracks([make_track(1)], "Track")
+    
+    first = coordinator.lease('w1')
+    time.sleep(0.1)
+    second = coordinator.lease('w2')
+    assert second['job_id'] == first['job_id']
+    
+    # The first worker lost its lease
+    assert not coordinator.heartbeat(first['job_id'], 'w1', 10)
+    assert not coordinator.complete(first['job_id'], 'w1', "/music/a.mp3")
+    
+    time.sleep(0.1)
+    assert coordinator.lease('w3') is None
+    status = coordinator.status()
+    assert status['counts']['failed'] == 1
+    assert "Lease expired" in status['failed'][0]['error']
+
+
+def test_failure_is_retried_and_drops_cached_match(app):
+    coordinator = app.DownloadCoordinator(max_attempts=2)
+    coordinator.resolution_cache['id1'] = {'youtube_url': "https://youtu.be/bad", 'thumbnail': ""}
+    coordinator.add_tracks([make_track(1)], "Track")
+    
+    job = coordinator.lease('w1')
+    assert job['track']['youtube_url'] == "https://youtu.be/bad"
+    assert coordinator.fail(job['job_id'], 'w1', "Video unavailable")
+    
+    retry = coordinator.lease('w2')
+    assert 'youtube_url' not in retry['track']
+    assert coordinator.fail(retry['job_id'], 'w2', "Video unavailable")
+    assert coordinator.status()['failed'][0]['error'] == "Video unavailable"
+
+
+def test_stale_worker_gets_409(coordinator_url):
+    requests.post(f"{coordinator_url}/jobs", json={'tracks': [make_track(1)]})
+    job = requests.post(f"{coordinator_url}/lease", json={'worker_id': 'w1'}).json()['job']
+    
+    response = requests.post(f"{coordinator_url}/heartbeat", json={'worker_id': 'w2', 'job_id': job['job_id']})
+    assert response.status_code == 409
+    
+    response = requests.post(f"{coordinator_url}/complete", json={'worker_id': 'w1', 'job_id': job['job_id']})
+    assert response.status_code == 200
+    response = requests.post(f"{coordinator_url}/heartbeat", json={'worker_id': 'w1', 'job_id': job['job_id']})
+    assert response.status_code == 409
+
+
+@pytest.mark.parametrize("payload", [
+    {'tracks': [{'title': "No id", 'artist': "Artist"}]},
+    {'tracks': [{'id': "id1", 'artist': "Artist"}]},
+    {'tracks': ["id1"]},
+    {'tracks': "id1"},
+    {'tracks': [make_track(1)], 'download_dir': 5},
+    {},
+])
+def test_jobs_rejects_invalid_tracks(coordinator_url, payload):
+    response = requests.post(f"{coordinator_url}/jobs", json=payload)
+    assert response.status_code == 400
+    
+    status = requests.get(f"{coordinator_url}/status")
+    assert status.status_code == 200
+    assert status.json()['counts']['queued'] == 0
+
+
+def test_coordinator_with_two_worker_processes(home_dir, tmp_path):
+    port = free_port()
+    coordinator_url = f"http://127.0.0.1:{port}"
+    library = tmp_path / "library" # Shared storage for both workers
+    env = dict(os.environ, HOME=str(home_dir))
+    processes = [subprocess.Popen(
+        [sys.executable, str(APP_PATH), 'coordinator', '--port', str(port)],
+        env=env, stdout=subprocess.DEVNULL
+    )]
+    try:
+        assert wait_for(lambda: requests.get(f"{coordinator_url}/status").ok)
+        
+        tracks = [make_track(number) for number in range(8)]
+        response = requests.post(f"{coordinator_url}/jobs", json={'tracks': tracks, 'download_dir': "Playlist/Mix"})
+        assert response.json() == {'queued': 8}
+        
+        for worker_id in ('worker-1', 'worker-2'):
+            processes.append(subprocess.Popen(
+                [sys.executable, '-c', WORKER_SCRIPT, str(APP_PATH), coordinator_url, worker_id, str(library)],
+                env=env, stdout=subprocess.DEVNULL
+            ))
+        
+        assert wait_for(lambda: requests.get(f"{coordinator_url}/status").json()['counts']['completed'] == 8)
+        
+        files = sorted((library / "Playlist" / "Mix").iterdir())
+        assert [f.name for f in files] == [f"Artist - Title {number}.mp3" for number in range(8)]
+        assert {f.read_text() for f in files} == {'worker-1', 'worker-2'}
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait(timeout=10)